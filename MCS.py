@@ -9,59 +9,185 @@ MIBs and commands.
 
 import os
 import sys
-import zmq
-import math
 import time
+import atexit
+import errno
+import ctypes
 import select
 import socket
-import string
+import struct
 import logging
 import threading
-import traceback
-
-from io import StringIO
-from datetime import datetime
-from collections import deque
 
 __version__ = "0.3"
-__all__ = ['MCS_RCV_BYTES', 'getTime', 'Communicate', 'ReferenceServer'] 
+__all__ = ['MCS_RCV_BYTES', 'getTimeExact', 'getTime', 'Communicate', 'ReferenceServer'] 
 
 
 # Maximum number of bytes to receive from MCS
 MCS_RCV_BYTES = 16*1024
 
 
-def getTime():
+# Maximum number of MCS packets to pull from the kernel per recvmmsg() call
+MCS_RCV_BATCH = 32
+
+
+# Number of times to try sending a MCS response when the send buffer is full
+MCS_SND_ATTEMPTS = 3
+
+
+# Maximum number of MCS reply addresses and header prefixes to cache
+MCS_REPLY_CACHE = 256
+
+
+# Requested kernel buffer sizes for the MCS receive and send sockets
+MCS_RCV_BUFFER = 8*1024*1024
+MCS_SND_BUFFER = 2*1024*1024
+
+
+# Linux socket options to set buffer sizes beyond the rmem_max/wmem_max limits -
+# these are not exposed by the socket module
+if sys.platform.startswith('linux'):
+    _SO_SNDBUFFORCE = getattr(socket, 'SO_SNDBUFFORCE', 32)
+    _SO_RCVBUFFORCE = getattr(socket, 'SO_RCVBUFFORCE', 33)
+else:
+    _SO_SNDBUFFORCE = _SO_RCVBUFFORCE = None
+
+
+# Linux reports back double the buffer size that was granted, with the extra
+# covering the kernel's own bookkeeping overhead
+_SO_BUF_SCALE = 2 if sys.platform.startswith('linux') else 1
+
+
+# Fixed-width part of the MCS packet header:  destination, sender, command,
+# reference number, data length, MJD, and MPM.  The data section starts one
+# byte after this.
+_HDR = struct.Struct('3s3s3s9s4s6s9s')
+
+
+# Template for MCS response packets.  The first field is the pre-formatted
+# destination/sender/command prefix and the status is pre-padded to 7 bytes.
+_RESP_FMT = b"%s%9i%4i%6i%9i %c%s%s"
+
+
+# MJD of the Unix epoch, 1970-01-01 00:00:00 UTC
+_MJD_UNIX_EPOCH = 40587
+
+
+# Number of nanoseconds in a day
+_NS_PER_DAY = 86400*1000000000
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len',  ctypes.c_size_t)]
+
+
+class _sockaddr_in(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort),
+                ('sin_port',   ctypes.c_uint16),
+                ('sin_addr',   ctypes.c_ubyte*4),
+                ('sin_zero',   ctypes.c_ubyte*8)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [('msg_name',       ctypes.c_void_p),
+                ('msg_namelen',    ctypes.c_uint32),
+                ('msg_iov',        ctypes.POINTER(_iovec)),
+                ('msg_iovlen',     ctypes.c_size_t),
+                ('msg_control',    ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags',      ctypes.c_int)]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+# Batched receive via recvmmsg(2), if libc provides it
+try:
+    _libc = ctypes.CDLL('libc.so.6', use_errno=True)
+    _recvmmsg = _libc.recvmmsg
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint,
+                          ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+except (OSError, AttributeError):
+    _recvmmsg = None
+
+
+def _setSocketBuffer(sock, option, forceOption, size):
     """
-    Return a two-element tuple of the current MJD and MPM.
+    Set the size of a socket buffer, trying to get past the system limit with
+    the "force" version of the option if the kernel caps the request.  Returns
+    the buffer size granted by the kernel, which can be compared to `size`.
+    """
+    
+    sock.setsockopt(socket.SOL_SOCKET, option, size)
+    actual = sock.getsockopt(socket.SOL_SOCKET, option) // _SO_BUF_SCALE
+    if actual < size and forceOption is not None:
+        ## This needs CAP_NET_ADMIN
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, forceOption, size)
+            actual = sock.getsockopt(socket.SOL_SOCKET, option) // _SO_BUF_SCALE
+        except OSError:
+            pass
+    return actual
+
+
+def _unpackHeader(data):
+    """
+    Given a MCS UDP command packet, return a seven-element tuple of the
+    destination, sender, command, reference, data length, MJD, and MPM.  The
+    destination, sender, and command are returned as bytes.
     """
     
-    # determine current time
-    dt = datetime.utcnow()
-    year        = dt.year             
-    month       = dt.month      
-    day         = dt.day    
-    hour        = dt.hour
-    minute      = dt.minute
-    second      = dt.second     
-    millisecond = dt.microsecond / 1000
-
-    # compute MJD         
-    # adapted from http://paste.lisp.org/display/73536
-    # can check result using http://www.csgnetwork.com/julianmodifdateconv.html
-    a = (14 - month) // 12
-    y = year + 4800 - a          
-    m = month + (12 * a) - 3                    
-    p = day + (((153 * m) + 2) // 5) + (365 * y)   
-    q = (y // 4) - (y // 100) + (y // 400) - 32045
-    mjd = int(math.floor( (p+q) - 2400000.5))  
-
-    # compute MPM
-    mpm = int(math.floor( (hour*3600 + minute*60 + second)*1000 + millisecond ))
+    destination, sender, command, reference, datalen, mjd, mpm = _HDR.unpack_from(data)
+    return destination, sender, command, int(reference), int(datalen), int(mjd), int(mpm)
+
 
+def getTimeExact():
+    """
+    Return a two-element tuple of the current MJD and MPM.
+    """
+    
+    # determine current time in ns since the Unix epoch
+    ns = time.time_ns()
+    
+    # compute MJD and MPM directly from the Unix time
+    mjd = _MJD_UNIX_EPOCH + ns // _NS_PER_DAY
+    mpm = (ns // 1000000) % 86400000
+    
     return (mjd, mpm)
 
 
+# Last millisecond seen by getTime() and the corresponding (MJD, MPM) tuple.
+# This is replaced as a single tuple so that it is safe to share across threads.
+_timeCache = (None, None)
+
+
+def getTime():
+    """
+    Return a two-element tuple of the current MJD and MPM.  This is the same
+    as getTimeExact() but reuses the result for calls within the same
+    millisecond.
+    """
+    
+    global _timeCache
+    
+    # determine current time in ms since the Unix epoch
+    ms = time.time_ns() // 1000000
+    
+    lastMS, lastTime = _timeCache
+    if ms == lastMS:
+        return lastTime
+        
+    # compute MJD and MPM directly from the Unix time
+    lastTime = (_MJD_UNIX_EPOCH + ms // 86400000, ms % 86400000)
+    _timeCache = (ms, lastTime)
+    
+    return lastTime
+
+
 
 class Communicate(object):
     """
@@ -79,8 +205,14 @@ class Communicate(object):
         # Setup the poller
         self.poller = None
         
+        # Cache the encoded sender name and system status for sendResponse
+        self.updateSender()
+        self._status = None
+        self._status_b = b''
+        
         # Set the logger
         self.logger = logging.getLogger('__main__')
+        self.updateLogging()
         
     def updateConfig(self, config=None):
         """
@@ -91,17 +223,43 @@ class Communicate(object):
         if config is not None:
             self.config = config
         
+    def updateLogging(self):
+        """
+        Refresh the cached check of whether or not debug logging is enabled.
+        This needs to be called if the level of the logger is changed.
+        """
+        
+        self._debug = self.logger.isEnabledFor(logging.DEBUG)
+        
+    def updateSender(self):
+        """
+        Refresh the cached sender name used in responses and to filter incoming
+        packets by destination.  This needs to be called if the subsystem name
+        of SubSystemInstance is changed.
+        """
+        
+        self._sender_b = self.SubSystemInstance.subSystem.encode('ascii')
+        self._prefixes = {}
+        self._acceptDestinations = frozenset((self._sender_b, b'ALL'))
+        
     def start(self):
         """
         Start the recieve thread - send will run only when needed.
         """
         
+        # Pick up any changes to the logging level
+        self.updateLogging()
+        
         # Setup the various sockets
         ## Receive
         try:
             self.socketIn =  socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            rcvBuf = _setSocketBuffer(self.socketIn, socket.SO_RCVBUF, _SO_RCVBUFFORCE, MCS_RCV_BUFFER)
             self.socketIn.bind((self.config['mcs']['message_out_host'], self.config['mcs']['message_in_port']))
-            #self.socketIn.setblocking(0)
+            self.socketIn.setblocking(0)
+            self.logger.info('Listening with a %i B receive buffer', rcvBuf)
+            if rcvBuf < MCS_RCV_BUFFER:
+                self.logger.warning('Receive buffer is smaller than the requested %i B, check net.core.rmem_max', MCS_RCV_BUFFER)
         except socket.error as err:
             code, e = err
             self.logger.critical('Cannot bind to listening port %i: %s', self.config['mcs']['message_in_port'], str(e))
@@ -112,8 +270,13 @@ class Communicate(object):
         ## Send
         try:
             self.socketOut = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sndBuf = _setSocketBuffer(self.socketOut, socket.SO_SNDBUF, _SO_SNDBUFFORCE, MCS_SND_BUFFER)
+            self.logger.info('Sending with a %i B send buffer', sndBuf)
+            if sndBuf < MCS_SND_BUFFER:
+                self.logger.warning('Send buffer is smaller than the requested %i B, check net.core.wmem_max', MCS_SND_BUFFER)
             self.destAddress = (self.config['mcs']['message_out_host'], self.config['mcs']['message_out_port'])
-            #self.socketIn.setblocking(0)
+            self._replyAddresses = {}
+            self.socketOut.setblocking(0)
         except socket.error as err:
             code, e = err
             self.logger.critical('Cannot bind to sending port %i: %s', self.config['mcs']['message_out_port'], str(e))
@@ -121,23 +284,78 @@ class Communicate(object):
             logging.shutdown()
             sys.exit(1)
             
-        # Create the incoming socket poller
-        self.poller = select.poll()
-        self.poller.register(self.socketIn, select.POLLIN | select.POLLPRI)
-
+        # Create the incoming socket poller - this is edge triggered so we need
+        # to drain the socket every time it fires
+        self.poller = select.epoll()
+        self.poller.register(self.socketIn.fileno(), select.EPOLLIN | select.EPOLLET)
+        
+        # Setup the persistent receive buffers and, if we can, the recvmmsg()
+        # headers that point into them
+        self._rcvBuffers = [bytearray(MCS_RCV_BYTES) for i in range(MCS_RCV_BATCH)]
+        self._rcvViews = [memoryview(buf) for buf in self._rcvBuffers]
+        self._rcvHdrs = None
+        if _recvmmsg is not None:
+            self._rcvCBuffers = [(ctypes.c_char*MCS_RCV_BYTES).from_buffer(buf) for buf in self._rcvBuffers]
+            self._rcvAddrs = (_sockaddr_in*MCS_RCV_BATCH)()
+            self._rcvIOVs = (_iovec*MCS_RCV_BATCH)()
+            self._rcvHdrs = (_mmsghdr*MCS_RCV_BATCH)()
+            for i in range(MCS_RCV_BATCH):
+                self._rcvIOVs[i].iov_base = ctypes.addressof(self._rcvCBuffers[i])
+                self._rcvIOVs[i].iov_len = MCS_RCV_BYTES
+                
+                hdr = self._rcvHdrs[i].msg_hdr
+                hdr.msg_name = ctypes.addressof(self._rcvAddrs[i])
+                hdr.msg_namelen = ctypes.sizeof(_sockaddr_in)
+                hdr.msg_iov = ctypes.pointer(self._rcvIOVs[i])
+                hdr.msg_iovlen = 1
+        
     def stop(self):
         """
         Stop the receive thread, waiting until it's finished.
         """
         
         # Stop the poller
-        self.poller.unregister(self.socketIn)
+        self.poller.close()
         self.poller = None
         
         # Close the various sockets
         self.socketIn.close()
         self.socketOut.close()
         
+    def _receiveBatch(self):
+        """
+        Read up to MCS_RCV_BATCH packets from the listening socket with a
+        single recvmmsg() call and return them as a list of (data, address)
+        tuples.  The data are memoryviews into the persistent receive buffers
+        and are only valid until the next call.
+        """
+        
+        if self._rcvHdrs is None:
+            try:
+                n, address = self.socketIn.recvfrom_into(self._rcvBuffers[0])
+                return [(self._rcvViews[0][:n], address),]
+            except BlockingIOError:
+                return []
+        
+        n = _recvmmsg(self.socketIn.fileno(), self._rcvHdrs, MCS_RCV_BATCH, socket.MSG_DONTWAIT, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            if err == errno.ENOSYS:
+                ## No recvmmsg() in this kernel - switch to recvfrom_into()
+                self.logger.warning('recvmmsg() is not supported, falling back to recvfrom_into()')
+                self._rcvHdrs = None
+                return self._receiveBatch()
+            raise OSError(err, os.strerror(err))
+        
+        packets = []
+        for i in range(n):
+            addr = self._rcvAddrs[i]
+            address = (socket.inet_ntoa(bytes(addr.sin_addr)), socket.ntohs(addr.sin_port))
+            packets.append( (self._rcvViews[i][:self._rcvHdrs[i].msg_len], address) )
+        return packets
+        
     def receiveCommand(self):
         """
         Recieve and process MCS command over the network and add it to the packet 
@@ -146,29 +364,41 @@ class Communicate(object):
         
         ngood = 0
         nerr = 0
-        for fd,flag in self.poller.poll(1000):
-            # Read - we are only listening to one socket
-            dataAddress = self.socketIn.recvfrom(MCS_RCV_BYTES)
-            
-            # Process
-            try:
-                sender, status, command, reference, packed_data, address = self.processCommand(dataAddress)
-            except Exception as e:
-                nerr += 1
-                self.logger.error("processCommand failed with: %s", str(e))
-                continue
-                
-            # Respond
-            try:
-                self.sendResponse(sender, status, command, reference, packed_data, address)
-            except Exception as e:
-                nerr += 1
-                self.logger.error("sendResponse failed with: %s", str(e))
-                continue
-                
-            # Increment
-            ngood += 1
-            
+        receiveBatch = self._receiveBatch
+        processCommand = self.processCommand
+        sendResponse = self.sendResponse
+        acceptDestinations = self._acceptDestinations
+        for fd,flag in self.poller.poll(1):
+            # Read until the socket is empty - we are only listening to one socket
+            while True:
+                packets = receiveBatch()
+                if len(packets) == 0:
+                    break
+                    
+                for dataAddress in packets:
+                    # Skip anything that is not addressed to us before parsing it
+                    if bytes(dataAddress[0][:3]) not in acceptDestinations:
+                        continue
+                        
+                    # Process
+                    try:
+                        sender, status, command, reference, packed_data, address = processCommand(dataAddress)
+                    except Exception as e:
+                        nerr += 1
+                        self.logger.error("processCommand failed with: %s", str(e))
+                        continue
+                    
+                    # Respond
+                    try:
+                        sendResponse(sender, status, command, reference, packed_data, address)
+                    except Exception as e:
+                        nerr += 1
+                        self.logger.error("sendResponse failed with: %s", str(e))
+                        continue
+                    
+                    # Increment
+                    ngood += 1
+        
         return ngood, nerr
         
     def sendResponse(self, destination, status, command, reference, data, address=None):
@@ -177,36 +407,65 @@ class Communicate(object):
         """
     
         if status:
-            response = 'A'
+            response = 0x41     # 'A'
         else:
-            response = 'R'
+            response = 0x52     # 'R'
             
-        # Set the sender
-        sender = self.SubSystemInstance.subSystem
-
         # Get current time
         (mjd, mpm) = getTime()
         
-        # Get the current system status
-        systemStatus = self.SubSystemInstance.currentState['status']
-
-        # Build the payload
-        payload = "%3s%3s%3s%9i" % (destination, sender, command, reference)
-        payload += "%4i%6i%9i" % (len(data)+8, mjd, mpm)
-        payload += ' ' + response + ("%7s" % systemStatus) + data
-        payload = payload.encode()
+        # Get the current system status, re-encoding it only when it changes
+        ss = self.SubSystemInstance
+        systemStatus = ss.currentState['status']
+        if systemStatus != self._status:
+            self._status = systemStatus
+            self._status_b = b"%7s" % systemStatus.encode()
+            
+        # Get the destination/sender/command prefix
+        prefix = self._prefixes.get((destination, command))
+        if prefix is None:
+            if len(self._prefixes) >= MCS_REPLY_CACHE:
+                self._prefixes.clear()
+            prefix = b"%3s%3s%3s" % (destination.encode(), self._sender_b, command.encode())
+            self._prefixes[(destination, command)] = prefix
             
+        # Build the payload
+        if not isinstance(data, (bytes, bytearray)):
+            data = data.encode()
+        payload = _RESP_FMT % (prefix, reference, len(data)+8, mjd, mpm, response, self._status_b, data)
+        
         try:
             if address is None:
                 address = self.destAddress
             else:
-                address = (address[0], self.config['mcs']['message_out_port'])
-            bytes_sent = self.socketOut.sendto(payload, address)
-            self.logger.debug("mcsSend - Sent to %s '%s'", address, payload)
-            return True
+                ## Reuse the reply address tuple for hosts we have already seen
+                try:
+                    address = self._replyAddresses[address[0]]
+                except KeyError:
+                    if len(self._replyAddresses) >= MCS_REPLY_CACHE:
+                        self._replyAddresses.clear()
+                    address = self._replyAddresses[address[0]] = (address[0], self.destAddress[1])
+                    
+            for attempt in range(MCS_SND_ATTEMPTS):
+                try:
+                    bytes_sent = self.socketOut.sendto(payload, address)
+                    if self._debug:
+                        self.logger.debug("mcsSend - Sent to %s '%s'", address, payload)
+                    return True
+                except BlockingIOError:
+                    pass
+                except OSError as e:
+                    if e.errno != errno.ENOBUFS:
+                        raise
+                        
+                ## The send buffer is full - wait for it to drain before retrying
+                select.select([], [self.socketOut], [], 0.005)
+                
+            self.logger.warning("mcsSend - Failed to send response to %s after %i attempts", address, MCS_SND_ATTEMPTS)
+            return False
             
         except socket.error:
-            self.logger.warning("mcsSend - Failed to send response to %s, retrying", address)
+            self.logger.warning("mcsSend - Failed to send response to %s", address)
             return False
             
     def parsePacket(self, data):
@@ -225,21 +484,17 @@ class Communicate(object):
         
         data, address = data
         try:
-            data = data.decode()
-        except UnicodeDecodeError as e:
-            raise RuntimeError("Failed to decode packet '%s' from %s: %s" % (data, address, str(e)))
+            destination, sender, command, reference, datalen, mjd, mpm = _unpackHeader(data)
+        except (struct.error, ValueError) as e:
+            raise RuntimeError("Failed to parse packet '%s' from %s: %s" % (bytes(data), address, str(e)))
             
         try:
-            destination = data[:3]
-            sender      = data[3:6]
-            command     = data[6:9]
-            reference   = int(data[9:18])
-            datalen     = int(data[18:22])
-            mjd         = int(data[22:28])
-            mpm         = int(data[28:37])
-            data        = data[38:38+datalen]
-        except ValueError as e:
-            raise RuntimeError("Failed to parse packet '%s' from %s: %s" % (data, address, str(e)))
+            destination = destination.decode('ascii')
+            sender      = sender.decode('ascii')
+            command     = command.decode('ascii')
+            data        = str(data[38:38+datalen], 'utf-8')
+        except UnicodeDecodeError as e:
+            raise RuntimeError("Failed to decode packet '%s' from %s: %s" % (bytes(data), address, str(e)))
             
         return destination, sender, command, reference, datalen, mjd, mpm, data, address
         
@@ -282,8 +537,16 @@ class ReferenceServer(object):
         # Setup threading
         self.thread = None
         self.alive = threading.Event()
+        self.ready = threading.Event()
         
-    def start(self):
+        # Setup the reference number checkpointing
+        self._ref = None
+        self._savedRef = None
+        self._savedAt = 0.0
+        self._lock = threading.Lock()
+        atexit.register(self._checkpoint)
+        
+    def start(self, timeout=5):
         """
         Start the reference server.
         """
@@ -292,11 +555,15 @@ class ReferenceServer(object):
             self.stop()
             
         self.thread = threading.Thread(target=self._generator, name='generator')
-        self.thread.setDaemon(1)
+        self.thread.daemon = True
         self.alive.set()
+        self.ready.clear()
         self.thread.start()
-        time.sleep(1)
         
+        # Wait for the generator to bind its socket
+        if not self.ready.wait(timeout):
+            self.logger.warning('Reference number server did not become ready within %i s', timeout)
+            
         self.logger.info('Started the reference number server')
         
     def stop(self):
@@ -312,54 +579,92 @@ class ReferenceServer(object):
             
             self.logger.info('Stopped the reference number server')
             
+    def _checkpoint(self):
+        """
+        Save the current reference number to disk if it has changed since the
+        last checkpoint.
+        """
+        
+        with self._lock:
+            ref = self._ref
+            self._savedAt = time.time()
+            if ref is None or ref == self._savedRef:
+                return
+                
+            with open('.sc_reference_id.tmp', 'w') as fh:
+                fh.write("%i" % ref)
+            os.replace('.sc_reference_id.tmp', '.sc_reference_id')
+            self._savedRef = ref
+            
+    def _openSocket(self, context, timeout):
+        """
+        Create and bind the ZMQ REP socket used to hand out reference IDs.
+        """
+        
+        import zmq
+        
+        socket = context.socket(zmq.REP)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.setsockopt(zmq.RCVTIMEO, timeout*1000)
+        socket.bind("tcp://%s:%i" % (self.address, self.port))
+        return socket
+        
     def _generator(self, timeout=5):
+        import zmq
+        
         ref = 1
         if os.path.exists('.sc_reference_id'):
             with open('.sc_reference_id', 'r') as fh:
                 ref = int(fh.read(), 10)
                 
-            ref += 10
+            # Skip past any IDs that may have been handed out after the last
+            # checkpoint
+            ref += 1000
             if ref > 999999999:
                 ref = 1
                 
-        while self.alive.isSet():
-            self.logger.info('_generator: starting with ID %i' % ref)
-            
-            context = zmq.Context()
-            socket = context.socket(zmq.REP)
-            socket.bind("tcp://%s:%i" % (self.address, self.port))
-            
-            poller = zmq.Poller()
-            poller.register(socket, zmq.POLLIN)
-            
-            while self.alive.isSet():
-                events = dict(poller.poll(timeout*1000))
-                if socket in events and events[socket] == zmq.POLLIN:
-                    try:
-                        message = socket.recv()
-                    except zmq.ZMQError as e:
-                        self.logger.error('_generator: error on recv, restarting: %s', str(e))
-                        break
-                    if message == b'next_ref':
-                        payload = b"%i" % ref
-                        try:
-                            socket.send(payload)
-                        except zmq.ZMQError as e:
-                            self.logger.error('_generator: error on send: %s', str(e))
-                            continue
-                            
-                        ref += 1
-                        if ref > 999999999:
-                            self.logger.info('_generator: rolling ID counter back to 1')
-                            ref = 1
-                            
-                        if ref % 10 == 0:
-                            with open('.sc_reference_id', 'w') as fh:
-                                fh.write("%i" % ref)
-                                
-            poller.unregister(socket)
-            socket.close()
-            context.term()
-            
-            with open('.sc_reference_id', 'w') as fh:
-                fh.write("%i" % ref)
+        self._ref = ref
+        
+        self.logger.info('_generator: starting with ID %i' % ref)
+        
+        # Setup the socket once for the life of the server.  It only gets
+        # rebuilt if it ends up in a bad state.
+        context = zmq.Context()
+        socket = self._openSocket(context, timeout)
+        self.ready.set()
+        
+        while self.alive.is_set():
+            # Periodically save the reference number, outside of the request path
+            if time.time() - self._savedAt >= timeout:
+                self._checkpoint()
+                
+            try:
+                message = socket.recv()
+                if message == b'next_ref':
+                    socket.send(str(ref).encode('ascii'))
+                    
+                    ref = (ref % 999999999) + 1
+                    self._ref = ref
+                else:
+                    # Always reply so that the REP socket is ready for the 
+                    # next request
+                    self.logger.warning('_generator: unexpected request: %s', repr(message[:32]))
+                    socket.send(b'')
+            except zmq.Again:
+                continue
+            except zmq.ZMQError as e:
+                # The socket may now be stuck between a request and a reply, 
+                # start over with a new one after a short wait
+                self.logger.error('_generator: error, resetting socket: %s', str(e))
+                socket.close()
+                time.sleep(1)
+                try:
+                    socket = self._openSocket(context, timeout)
+                except zmq.ZMQError as e:
+                    self.logger.error('_generator: cannot rebind socket: %s', str(e))
+                    break
+                    
+        socket.close()
+        context.term()
+        
+        self._checkpoint()
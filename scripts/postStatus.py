@@ -3,11 +3,11 @@
 import os
 import sys
 import json
-import pytz
 import time
-import subprocess
+import hashlib
+import argparse
 from socket import gethostname
-from datetime import datetime
+from datetime import datetime, timezone
 
 from lwa_auth import KEYS as LWA_AUTH_KEYS
 from lwa_auth.signed_requests import post as signed_post
@@ -15,56 +15,142 @@ from lwa_auth.signed_requests import post as signed_post
 URL = "https://lwalab.phys.unm.edu/OpScreen/update"
 SITE = gethostname().split('-', 1)[0]
 PATH = os.path.dirname(os.path.abspath(__file__))
+LAST_POST_FILENAME = os.path.join(PATH, '.postStatus.last')
 
-UTC = pytz.UTC
+# smartQuery.py is installed alongside this script
+sys.path.insert(0, PATH)
+from smartQuery import query, closeConnection
 
-def _serialize_datetime(value):
+
+def get_status():
+    """
+    Query the smart copy server and return a three-element tuple of the
+    overall summary, the total number of queued copies, and the number of
+    active copies.
+    """
+    
+    summary = 'NORMAL'
+    validDRs = (1, 2, 3, 4, 5)
+    if SITE != 'lwa1':
+        validDRs = (1, 2, 3, 4)
+        
+    total_count = 0
+    active_count = 0
+    for dr in validDRs:
+        try:
+            status, _, count = query(f"QUEUE_SIZE_DR{dr}")
+            if status == 'A':
+                count = int(count)
+                total_count += count
+                
+            status, _, count = query(f"ACTIVE_ID_DR{dr}")
+            if status == 'A':
+                try:
+                    count = int(count)
+                    count = 1
+                except ValueError:
+                    count = 0
+                active_count += count
+                
+        except (RuntimeError, ValueError):
+            summary = 'ERROR'
+            continue
+            
+    return summary, total_count, active_count
+
+
+def _load_last_post():
+    """
+    Load the digest and time of the last update that was posted.  Returns
+    (None, 0.0) if there is no record of a previous update.
+    """
+    
     try:
-        if value.tzinfo is not None:
-            value = value.astimezone(UTC)
-        return value.isoformat() + 'Z'
-    except AttributeError:
-        return value
-
-summary = 'NORMAL'
-validDRs = (1, 2, 3, 4, 5)
-if SITE != 'lwa1':
-    validDRs = (1, 2, 3, 4)
+        with open(LAST_POST_FILENAME, 'r') as fh:
+            digest, tPost = fh.read().split()
+        return digest, float(tPost)
+    except (OSError, ValueError):
+        return None, 0.0
+
+
+def _save_last_post(digest, tPost):
+    """
+    Save the digest and time of the last update that was posted.
+    """
     
-total_count = 0
-active_count = 0
-for dr in validDRs:
     try:
-        output = subprocess.check_output([os.path.join(PATH, 'smartQuery.py'), f"QUEUE_SIZE_DR{dr}"])
-        output = output.decode()
-        output = output.split('\n')[-2]
-        status, _, count = output.split(None, 2)
-        if status == 'A':
-            count = int(count)
-            total_count += count
-            
-        output = subprocess.check_output([os.path.join(PATH, 'smartQuery.py'), f"ACTIVE_ID_DR{dr}"])
-        output = output.decode()
-        output = output.split('\n')[-2]
-        status, _, count = output.split(None, 2)
-        if status == 'A':
-            try:
-                count = int(count)
-                count = 1
-            except ValueError:
-                count = 0
-        active_count += count
+        with open(LAST_POST_FILENAME+'.tmp', 'w') as fh:
+            fh.write(f"{digest} {tPost:.3f}")
+        os.replace(LAST_POST_FILENAME+'.tmp', LAST_POST_FILENAME)
+    except OSError:
+        pass
+
+
+def post_once(last_post=None, heartbeat=300.0):
+    """
+    Post the current state of the smart copy queues to the OpScreen.  The
+    update is skipped if the state is the same as the one posted last time and
+    that post is less than `heartbeat` seconds old.  Returns a two-element
+    tuple of the digest and time of the last update posted, which can be
+    passed back in as `last_post` on the next call.
+    """
+    
+    # NOTE:  The connection is closed after every update so that the reply 
+    #        port stays free for the other smart copy clients on this host
+    try:
+        summary, total_count, active_count = get_status()
+    finally:
+        closeConnection()
         
-    except subprocess.CalledProcessError:
-        summary = 'ERROR'
-        continue
+    # Check whether or not anything has changed, ignoring the timestamp
+    digest = hashlib.blake2b(json.dumps([SITE, summary, total_count, active_count]).encode(),
+                             digest_size=16).hexdigest()
+    if last_post is None:
+        last_post = _load_last_post()
+    tNow = time.time()
+    if digest == last_post[0] and tNow - last_post[1] < heartbeat:
+        return last_post
         
-data = [{'site': SITE,
-         'summary': summary, 
-         'total': total_count,
-         'active': active_count,
-         'update': datetime.utcnow()},]
-data = json.dumps(data, default=_serialize_datetime)
-f = signed_post(LWA_AUTH_KEYS.get(SITE+'-log', kind='private'), URL,
-                data={'site': 'elwa', 'subsystem': 'ASP', 'data': data})
-f.close()
+    data = [{'site': SITE,
+             'summary': summary, 
+             'total': total_count,
+             'active': active_count,
+             'update': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')},]
+    data = json.dumps(data)
+    f = signed_post(LWA_AUTH_KEYS.get(SITE+'-log', kind='private'), URL,
+                    data={'site': 'elwa', 'subsystem': 'ASP', 'data': data})
+    f.close()
+    
+    _save_last_post(digest, tNow)
+    return digest, tNow
+
+
+def main(args):
+    if not args.daemon:
+        post_once(heartbeat=args.heartbeat)
+        return
+        
+    last_post = None
+    while True:
+        tStart = time.time()
+        try:
+            last_post = post_once(last_post=last_post, heartbeat=args.heartbeat)
+        except Exception as e:
+            print(f"Failed to post status: {str(e)}", file=sys.stderr)
+            
+        time.sleep(max(0.0, args.interval - (time.time() - tStart)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Post the status of the smart copy queues to the OpScreen',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+    parser.add_argument('-d', '--daemon', action='store_true',
+                        help='keep running and post an update every interval')
+    parser.add_argument('-i', '--interval', type=float, default=60.0,
+                        help='time in seconds between updates when running as a daemon')
+    parser.add_argument('-b', '--heartbeat', type=float, default=300.0,
+                        help='maximum time in seconds between updates when nothing has changed')
+    args = parser.parse_args()
+    main(args)
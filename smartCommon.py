@@ -3,6 +3,10 @@ import os
 import re
 import sys
 import time
+import stat
+import errno
+import atexit
+import shutil
 import uuid
 import queue as Queue
 import select
@@ -15,11 +19,13 @@ import logging
 from io import StringIO
 from socket import gethostname
 
-from collections import OrderedDict
+from itertools import count
+from collections import OrderedDict, deque
 
 __version__ = '0.3'
 __all__ = ['SerialNumber', 'LimitedSizeDict', 'DiskBackedQueue', 
-           'InterruptibleCopy', 'DELETE_MARKER_QUEUE', 'DELETE_MARKER_NOW']
+           'InterruptibleCopy', 'DELETE_MARKER_QUEUE', 'DELETE_MARKER_NOW',
+           'getSSHCommand']
 
 
 smartCommonLogger = logging.getLogger('__main__')
@@ -34,27 +40,86 @@ if gethostname().split('-', 1)[0] in ('lwasv',):
     IS_UNRELIABLE_LINK = True
 
 
+# OpenSSH connection sharing - repeated ssh calls to the same host reuse a 
+# single authenticated connection that is kept open for this many seconds
+SSH_CONTROL_PERSIST = 300
+
+
+def getSSHCommand(host, tty=True):
+    """
+    Return the start of a subprocess-compatible ssh command that runs as 
+    mcsdr on the specified host over a shared connection.  If tty is False
+    no pseudo-terminal is allocated and ssh will never prompt, which is what
+    short, non-interactive commands want.  Long running commands that rely
+    on 'shopt -s huponexit' to be stopped need the pseudo-terminal.
+    """
+    
+    if tty:
+        cmd = ["ssh", "-t", "-t"]
+    else:
+        cmd = ["ssh", "-T", "-o", "BatchMode=yes"]
+    cmd.extend(["-o", "ControlMaster=auto",
+                "-o", "ControlPath=~/.ssh/smartcopy-%r@%h:%p",
+                "-o", "ControlPersist=%i" % SSH_CONTROL_PERSIST,
+                "-o", "ServerAliveInterval=30",
+                "mcsdr@%s" % host.lower()])
+    return cmd
+
+
+def _getLocalSize(path):
+    """
+    Return the apparent size in bytes of a local file or directory tree, 
+    like 'du -bs', or 0 if it cannot be found.
+    """
+    
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return 0
+    if not stat.S_ISDIR(st.st_mode):
+        return st.st_size
+        
+    # Walk the tree, counting directories and hard linked files only once
+    size, seen = st.st_size, set()
+    for root, dirs, files in os.walk(path):
+        for name in dirs+files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+            size += st.st_size
+    return size
+
+
+# Local file-to-file copies are done in chunks of this many bytes so that 
+# they can be paused and report progress
+LOCAL_COPY_CHUNK = 64*1024*1024
+
+
+# DiskBackedQueue write coalescing - the on-disk copy is updated after this 
+# many changes or this many seconds, whichever comes first
+QUEUE_FLUSH_COUNT = 32
+QUEUE_FLUSH_INTERVAL = 1.0
+
+
 class SerialNumber(object):
     """
     Simple class for a serial number generator.
     """
     
     def __init__(self):
-        self.sn = 1
-        self.lock = threading.Semaphore()
+        # NOTE:  next() on an itertools.count is atomic so no lock is needed
+        self._counter = count(1)
         
     def get(self):
-        self.lock.acquire()
-        out = self.sn*1
-        self.sn += 1
-        self.lock.release()
-        
-        return out
+        return next(self._counter)
         
     def reset(self):
-        self.lock.acquire()
-        self.sn = 1
-        self.lock.release()
+        self._counter = count(1)
         
         return True
 
@@ -66,18 +131,18 @@ class LimitedSizeDict(OrderedDict):
     """
     
     def __init__(self, *args, **kwds):
+        # NOTE:  The limit needs to be in place before OrderedDict.__init__
+        #        since any initial items go through __setitem__
         self.size_limit = kwds.pop("size_limit", None)
         OrderedDict.__init__(self, *args, **kwds)
-        self._check_size_limit()
         
     def __setitem__(self, key, value):
         OrderedDict.__setitem__(self, key, value)
-        self._check_size_limit()
         
-    def _check_size_limit(self):
-        if self.size_limit is not None:
-            while len(self) > self.size_limit:
-                self.popitem(last=False)
+        # Only one item is added at a time so at most one needs to go
+        limit = self.size_limit
+        if limit is not None and len(self) > limit:
+            self.popitem(last=False)
 
 
 class DiskBackedQueue(Queue.Queue):
@@ -90,9 +155,22 @@ class DiskBackedQueue(Queue.Queue):
     
     def __init__(self, filename, maxsize=0, restore=True):
         self._filename = filename
-        self._lock = threading.RLock()
+        self._lock = threading.Lock()
         Queue.Queue.__init__(self, maxsize=maxsize)
         
+        # In-memory mirror of the on-disk copy, in queue order and keyed by a 
+        # sequence number that also travels with each item through the queue,
+        # the sequence numbers of the items that have been handed out by get()
+        # but not yet marked as done, and the bookkeeping for coalescing the 
+        # writes
+        self._seq = count()
+        self._entries = OrderedDict()
+        self._inflight = deque()
+        self._pending = 0
+        self._dirty = threading.Event()
+        self._full = threading.Event()
+        self._io_lock = threading.Lock()
+        
         # See if we need to restore from disk
         self.restored = []
         with self._lock:
@@ -102,6 +180,7 @@ class DiskBackedQueue(Queue.Queue):
                         with open(self._filename, 'rb') as fh:
                             contents = fh.read()
                         contents = contents.split(self._sep)
+                        loaded = []
                         for i,entry in enumerate(contents):
                             try:
                                 item = pickle.loads(entry)
@@ -114,55 +193,128 @@ class DiskBackedQueue(Queue.Queue):
                                 if id < 1024:
                                     id += 1024
                                     item = (host, hostpath, dest, destpath, id, retries, lasttry)
-                                Queue.Queue.put(self, item)
-                                self.restored.append(item)
+                                loaded.append((item, entry))
                             except Exception as e:
                                 warnings.warn("Failed to load entry %i of '%s': %s" \
                                               % (i, os.path.basename(self._filename), str(e)),
                                               RuntimeWarning)
+                                              
+                        ## The file is newest entry first so flip it around 
+                        ## to get back to queue order and then load everything
+                        ## into the queue in one go
+                        wrapped = []
+                        for item,entry in reversed(loaded):
+                            seq = next(self._seq)
+                            self._entries[seq] = entry
+                            wrapped.append((seq, item))
+                            self.restored.append(item)
+                        with self.mutex:
+                            self.queue.extend(wrapped)
+                            self.unfinished_tasks += len(wrapped)
+                            self.not_empty.notify_all()
             else:
                 try:
                     os.unlink(self._filename)
                 except OSError:
                     pass
                     
-    def _queue_file_io(self, put=None, task_done=False):
-        with self._lock:
+        # Start the background writer and make sure that everything makes it
+        # to disk on the way out
+        self._writer = threading.Thread(target=self._writer_loop, name='DiskBackedQueue writer')
+        self._writer.daemon = True
+        self._writer.start()
+        atexit.register(self.flush)
+        
+    def _writer_loop(self):
+        """
+        Background thread that writes the queue out to disk once changes have
+        been waiting for QUEUE_FLUSH_INTERVAL seconds or QUEUE_FLUSH_COUNT of
+        them have accumulated.
+        """
+        
+        while True:
+            self._dirty.wait()
+            self._full.wait(QUEUE_FLUSH_INTERVAL)
             try:
-                with open(self._filename, 'rb') as fh:
-                    contents = fh.read()
-                contents = contents.split(self._sep)
-            except (OSError, IOError):
-                contents = []
+                self.flush()
+            except Exception as e:
+                smartCommonLogger.error("Failed to write '%s': %s", self._filename, str(e))
                 
-            if put is not None:
-                put = pickle.dumps(put, protocol=0)
-                contents.insert(0, put)
-                with open(self._filename, 'wb') as fh:
-                    fh.write(self._sep.join(contents))
-            elif task_done:
-                contents = contents[:-1]
-                with open(self._filename, 'wb') as fh:
-                    fh.write(self._sep.join(contents))
-                    
+    def _maybe_flush(self):
+        """
+        Record that the in-memory mirror has changed and let the background 
+        writer know.  This should only be called with the lock held.
+        """
+        
+        self._pending += 1
+        self._dirty.set()
+        if self._pending >= QUEUE_FLUSH_COUNT:
+            self._full.set()
+            
+    def flush(self):
+        """
+        Write any changes to the queue that have not yet made it to disk, 
+        newest entry first.
+        """
+        
+        with self._io_lock:
+            # Take a snapshot of the queue so that the lock is not held 
+            # while writing
+            with self._lock:
+                self._dirty.clear()
+                self._full.clear()
+                if self._pending == 0:
+                    return
+                contents = self._sep.join(reversed(self._entries.values()))
+                self._pending = 0
+                
+            tempname = self._filename+'.tmp'
+            with open(tempname, 'wb') as fh:
+                fh.write(contents)
+            os.replace(tempname, self._filename)
+            
     def put(self, item, block=True, timeout=None):
+        entry = pickle.dumps(item, protocol=0)
         with self._lock:
-            Queue.Queue.put(self, item, block=block, timeout=timeout)
-            self._queue_file_io(put=item)
+            seq = next(self._seq)
+            Queue.Queue.put(self, (seq, item), block=block, timeout=timeout)
+            self._entries[seq] = entry
+            self._maybe_flush()
             
     def put_nowait(self, item):
-        with self._lock:
-            Queue.Queue.put_nowait(self, item)
-            self._queue_file_io(put=item)
+        # Queue.Queue.put_nowait goes through self.put so there is nothing 
+        # extra to do here
+        return self.put(item, block=False)
             
+    def _get(self):
+        # Called by Queue.Queue.get with the queue's mutex held
+        seq, item = Queue.Queue._get(self)
+        self._inflight.append(seq)
+        return item
+        
     def task_done(self):
         with self._lock:
             Queue.Queue.task_done(self)
-            self._queue_file_io(task_done=True)
+            
+            # Remove the item that was handed out by its sequence number so 
+            # that nothing else in the queue is touched
+            try:
+                seq = self._inflight.popleft()
+            except IndexError:
+                return
+            if self._entries.pop(seq, None) is not None:
+                self._maybe_flush()
 
 
 class InterruptibleCopy(object):
-    _rsyncRE = re.compile('.*?(?P<transferred>\d) +(?P<progress>\d{1,3}%) +(?P<speed>\d+\.\d+[ kMG]B/s) +(?P<remaining>.*)')
+    # NOTE:  There can be a lot of these in flight and they are polled for 
+    #        status often so skip the per-instance __dict__
+    __slots__ = ('host', 'hostpath', 'dest', 'destpath', 'id', 'tries', 'last_try',
+                 'bw_limit', '_ssh', '_ssh_notty', 'thread', 'process', 'stdout',
+                 'stderr', 'status', '_poll', '_halt', '_started', '_done',
+                 '_progress', '_size')
+    
+    _rsyncRE = re.compile(r'^ *(?P<transferred>[\d,]+) +(?P<progress>\d{1,3}%) +(?P<speed>\d+\.\d+[ kMG]B/s) +(?P<remaining>.*)')
     
     def __init__(self, host, hostpath, dest, destpath, id=None, tries=0, last_try=0.0, bw_limit=0.0):
         # Copy setup
@@ -183,11 +335,26 @@ class InterruptibleCopy(object):
         # Bandwidth limiting in MB/s for remote copies
         self.bw_limit = bw_limit
         
+        # ssh command prefixes for remotely originating operations, with and 
+        # without a pseudo-terminal
+        self._ssh, self._ssh_notty = None, None
+        if self.host != '':
+            self._ssh = tuple(getSSHCommand(self.host))
+            self._ssh_notty = tuple(getSSHCommand(self.host, tty=False))
+        
         # Thread setup
         self.thread = None
         self.process= None
         self.stdout, self.stderr = '', ''
         self.status = ''
+        self._poll = select.poll()
+        self._halt = threading.Event()
+        self._started = threading.Event()
+        self._done = threading.Event()
+        
+        # Last progress reported by rsync as (transferred, progress, speed, 
+        # remaining)
+        self._progress = ('0', '0%', '0.00kB/s', '99:59:59')
         
         # Start the copy or delete running
         if time.time() - self.last_try > 86400.0:
@@ -234,11 +401,12 @@ class InterruptibleCopy(object):
         """
         
         if self.host == '':
-            cmd = ['du', '-b', self.hostpath]
-        else:
-            cmd = ["ssh", "-t", "-t", "mcsdr@%s" % self.host.lower()]
-            cmd.append('du -b %s' % self.hostpath)
+            # Local files can be checked directly
+            return os.path.exists(self.hostpath)
             
+        cmd = list(self._ssh_notty)
+        cmd.append('du -b %s' % self.hostpath)
+        
         try:
             output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL)
             output = output.decode()
@@ -258,16 +426,19 @@ class InterruptibleCopy(object):
             return self._size
         except AttributeError:
             if self.host == '':
-                cmd = ['du', '-b', self.hostpath]
-            else:
-                cmd = ["ssh", "-t", "-t", "mcsdr@%s" % self.host.lower()]
-                cmd.append('du -b %s' % self.hostpath)
+                # Local files and directories can be sized directly
+                self._size = str(_getLocalSize(self.hostpath))
+                return self._size
                 
+            # NOTE:  -s so that a directory gives a single total
+            cmd = list(self._ssh_notty)
+            cmd.append('du -bs %s' % self.hostpath)
+            
             try:
                 output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL)
                 output = output.decode()
                 self._size = output.split(None, 1)[0]
-            except subprocess.CalledProcessError:
+            except (subprocess.CalledProcessError, IndexError):
                 self._size = '0'
                 
             return self._size
@@ -277,38 +448,22 @@ class InterruptibleCopy(object):
         Return the number of bytes transferred.
         """
         
-        mtch = self._rsyncRE.search(self.stdout)
-        if mtch is not None:
-            trans = mtch.group('transferred')
-        else:
-            trans = "0"
-            
-        return trans
+        return self._progress[0].replace(',', '')
         
     def getProgress(self):
         """
         Return the percentage progress of the copy.
         """
         
-        mtch = self._rsyncRE.search(self.stdout)
-        if mtch is not None:
-            prog = mtch.group('progress')
-        else:
-            prog = '0%'
-            
-        return prog
+        return self._progress[1]
         
     def getSpeed(self):
         """
         Return the current copy speed or 'paused' if the copy is paused.
         """
         
-        if self.isRunning:
-            mtch = self._rsyncRE.search(self.stdout)
-            if mtch is not None:
-                speed = mtch.group('speed')
-            else:
-                speed = '0.00kB/s'
+        if self.isRunning():
+            speed = self._progress[2]
         else:
             speed = 'paused'
             
@@ -319,12 +474,8 @@ class InterruptibleCopy(object):
         Return the estimated time remaining or 'unknown' if the copy is paused.
         """
         
-        if self.isRunning:
-            mtch = self._rsyncRE.search(self.stdout)
-            if mtch is not None:
-                rema = mtch.group('remaining')
-            else:
-                rema = '99:59:59'
+        if self.isRunning():
+            rema = self._progress[3]
         else:
             rema = 'unknown'
             
@@ -345,13 +496,7 @@ class InterruptibleCopy(object):
         Return a Boolean of whether or not the copy is currently running.
         """
         
-        if self.thread is None:
-            return False
-        else:
-            if self.thread.isAlive():
-                return True
-            else:
-                return False
+        return self.thread is not None and not self._done.is_set()
                 
     def isComplete(self):
         """
@@ -395,10 +540,14 @@ class InterruptibleCopy(object):
         """
         
         if self.thread is not None:
-            try:
-                self.process.kill()
-            except OSError:
-                pass
+            ## NOTE:  The worker checks _halt both before and after it launches
+            ##        a process so there is no need to wait for the launch here
+            self._halt.set()
+            if self.process is not None:
+                try:
+                    self.process.kill()
+                except OSError:
+                    pass
             self.thread.join()
             
             self.thread = None
@@ -424,17 +573,24 @@ class InterruptibleCopy(object):
                 target = self._runDelete
             else:
                 target = self._runCopy
-            self.thread = threading.Thread(target=target)
-            self.thread.setDaemon(1)
-            self.thread.start()
+            self.thread = threading.Thread(target=self._runThread, args=(target,))
+            self.thread.daemon = True
             if self.status != 'paused':
                 self.tries += 1
                 if self.destpath in (DELETE_MARKER_NOW, DELETE_MARKER_QUEUE):
                     self.tries += 100
                 self.last_try = time.time()
+            ## NOTE:  The status needs to be set before the thread starts so 
+            ##        that a fast copy cannot finish before it is marked active
             self.status = 'active'
+            self._halt.clear()
+            self._started.clear()
+            self._done.clear()
+            self.thread.start()
             
-            time.sleep(1)
+            ## Wait for the process to launch, but no longer than the old fixed
+            ## one second delay
+            self._started.wait(1.0)
             
             return True
         else:
@@ -445,12 +601,23 @@ class InterruptibleCopy(object):
         Cancel the copy.
         """
         
-        if self.isRunning:
+        if self.isRunning():
             self.pause()
         self.status = 'canceled'
         
         return True
         
+    def _runThread(self, target):
+        """
+        Run the specified copy or delete method and flag when it has finished.
+        """
+        
+        try:
+            return target()
+        finally:
+            self._started.set()
+            self._done.set()
+            
     def _getTruncateCommand(self):
         """
         Build up a subprocess-compatible command needed to truncate a file on 
@@ -479,7 +646,7 @@ class InterruptibleCopy(object):
                 
         else:
             # Remotely originating copy
-            cmd = ["ssh", "-t", "-t", "mcsdr@%s" % self.host.lower()]
+            cmd = list(self._ssh_notty)
             
             if self.dest == self.host:
                 # Source and destination are on the same machine
@@ -511,7 +678,7 @@ class InterruptibleCopy(object):
                 
         else:
             # Remotely originating copy
-            cmd = ["ssh", "-t", "-t", "mcsdr@%s" % self.host.lower()]
+            cmd = list(self._ssh)
             
             if self.dest == self.host:
                 # Source and destination are on the same machine
@@ -526,6 +693,68 @@ class InterruptibleCopy(object):
                 
         return cmd
         
+    def _watchProcess(self):
+        """
+        Follow the stdout of the running process, keeping track of the latest
+        line and rsync progress, until it exits.  Then collect whatever is 
+        left in its stdout and stderr.
+        """
+        
+        fd = self.process.stdout.fileno()
+        os.set_blocking(fd, False)
+        self._poll.register(fd, select.POLLIN|select.POLLHUP)
+        
+        # Read from stdout while the copy is running so we can get 
+        # an idea of what is going on with the progress
+        partial = b''
+        while True:
+            ## Is there something to read?  If not, this waits for up to 
+            ## 500 ms.  The pipe closing also wakes us up.
+            if self._poll.poll(500):
+                try:
+                    new_text = os.read(fd, 65536)
+                except BlockingIOError:
+                    new_text = None
+                    
+                if new_text == b'':
+                    ### End of file, the process is on its way out
+                    break
+                    
+                if new_text:
+                    ### rsync separates its progress updates with carriage 
+                    ### returns so keep only the last complete, non-empty line
+                    ### and parse the most recent progress line just once
+                    lines = (partial + new_text).replace(b'\r', b'\n').split(b'\n')
+                    partial = lines.pop()[-4096:]
+                    latest = True
+                    for line in reversed(lines):
+                        if line.strip():
+                            line = line.decode('utf-8', 'replace').rstrip()
+                            if latest:
+                                self.stdout = line
+                                latest = False
+                            mtch = self._rsyncRE.match(line)
+                            if mtch is not None:
+                                self._progress = mtch.groups()
+                                break
+                            
+            ## Are we done?
+            self.process.poll()
+            if self.process.returncode is not None:
+                ### Yes, break out of this endless loop
+                break
+                
+        # Pull out anything that might be stuck in the buffers
+        self._poll.unregister(fd)
+        os.set_blocking(fd, True)
+        stdout, stderr = self.process.communicate()
+        
+        # Decode everything once so that stdout and stderr are always text
+        stdout = stdout.decode('utf-8', 'replace').rstrip()
+        if stdout:
+            self.stdout = stdout
+        self.stderr = stderr.decode('utf-8', 'replace')
+        
     def _runCopy(self):
         """
         Start the copy.
@@ -538,48 +767,46 @@ class InterruptibleCopy(object):
         trunc = self._getTruncateCommand()
         if trunc is not None:
             try:
-                trunc_p = subprocess.Popen(trunc)
+                trunc_p = subprocess.Popen(trunc, stdin=subprocess.DEVNULL)
                 trunc_s = trunc_p.wait()
                 smartCommonLogger.warning('Truncating destination file with \'%s\', status %i', ' '.join(trunc), trunc_s)
             except Exception as trunc_e:
                 smartCommonLogger.error('Error truncating destination file with \'%s\': %s', ' '.join(trunc), str(trunc_e))
                 
+        # Have we been paused while getting ready?
+        if self._halt.is_set():
+            self.status = 'paused'
+            return -1
+            
+        # Local file-to-file copies can be done in the kernel
+        ## NOTE:  This only covers a regular file, not a symlink, going into an 
+        ##        existing directory or to an explicit file name.  Everything 
+        ##        else is left to rsync so that it behaves the same as before.
+        if self.host == '' and self.dest == '':
+            try:
+                isRegular = stat.S_ISREG(os.lstat(self.hostpath).st_mode)
+            except OSError:
+                isRegular = False
+            if isRegular and (os.path.isdir(self.destpath) or not self.destpath.endswith('/')):
+                return self._runLocalCopy()
+            
         # Start up the process and start looking at the stdout
-        self.process = subprocess.Popen(cmd, bufsize=1, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
-        watchOut = select.poll()
-        watchOut.register(self.process.stdout)
+        ## NOTE:  A full path to the executable and close_fds=False let 
+        ##        subprocess use posix_spawn.  The descriptors that Python 
+        ##        opens are not inheritable so nothing extra leaks through.
+        cmd[0] = shutil.which(cmd[0]) or cmd[0]
+        self.process = subprocess.Popen(cmd, bufsize=0, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=False)
+        self._started.set()
+        if self._halt.is_set():
+            ## A pause came in while the process was launching
+            try:
+                self.process.kill()
+            except OSError:
+                pass
         smartCommonLogger.debug('Launched \'%s\' with PID %i', ' '.join(cmd), self.process.pid)
         
-        # Read from stdout while the copy is running so we can get 
-        # an idea of what is going on with the progress
-        while True:
-            ## Is there something to read?
-            stdout = ''
-            while watchOut.poll(1):
-                if self.process.poll() is None:
-                    try:
-                        new_text = self.process.stdout.read(1)
-                        new_text = new_text.decode()
-                        stdout += new_text
-                    except ValueError:
-                        break
-                else:
-                    break
-                    
-            ## Did we read something?  If not, sleep
-            if stdout == '':
-                time.sleep(1)
-            else:
-                self.stdout = stdout.rstrip()
-                
-            ## Are we done?
-            self.process.poll()
-            if self.process.returncode is not None:
-                ### Yes, break out of this endless loop
-                break
-                
-        # Pull out anything that might be stuck in the buffers
-        self.stdout, self.stderr = self.process.communicate()
+        # Follow the progress until the process exits
+        self._watchProcess()
         
         smartCommonLogger.debug('PID %i exited with code %i', self.process.pid, self.process.returncode)
         
@@ -588,11 +815,102 @@ class InterruptibleCopy(object):
         elif self.process.returncode < 0:
             self.status = 'paused'
         else:
-            smartCommonLogger.debug('copy failed -> %s', self.stderr.decode().rstrip())
-            self.status = 'error: %s' % self.stderr.decode()
+            smartCommonLogger.debug('copy failed -> %s', self.stderr.rstrip())
+            self.status = 'error: %s' % self.stderr
             
         return self.process.returncode
         
+    def _runLocalCopy(self):
+        """
+        Copy a single local file with copy_file_range(2), falling back to 
+        read/write if that is not possible.  Like rsync's --append this picks
+        up where any previous attempt left off and leaves destination files 
+        that are already at least as large as the source alone.
+        """
+        
+        self._started.set()
+        
+        target = self.destpath
+        if os.path.isdir(target):
+            target = os.path.join(target, os.path.basename(self.hostpath))
+        smartCommonLogger.debug('Copying %s to %s locally', self.hostpath, target)
+        
+        try:
+            src = os.open(self.hostpath, os.O_RDONLY)
+            try:
+                dst = os.open(target, os.O_WRONLY|os.O_CREAT, 0o644)
+                try:
+                    srcStat = os.fstat(src)
+                    size = srcStat.st_size
+                    offset = os.fstat(dst).st_size
+                    if offset >= size:
+                        smartCommonLogger.debug('Skipping %s since %s is already at least as large', self.hostpath, target)
+                        self._progress = (str(size), '100%', '0.00MB/s', '0:00:00')
+                        self.status = 'complete'
+                        return 0
+                        
+                    fast = hasattr(os, 'copy_file_range')
+                    tStart, oStart = time.time(), offset
+                    tLast = tStart
+                    while offset < size:
+                        ## Have we been paused?
+                        if self._halt.is_set():
+                            self.status = 'paused'
+                            return -1
+                            
+                        ## Copy the next chunk
+                        nbyte = min(LOCAL_COPY_CHUNK, size - offset)
+                        if fast:
+                            try:
+                                nbyte = os.copy_file_range(src, dst, nbyte, offset, offset)
+                            except OSError as e:
+                                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                                    raise
+                                fast = False
+                                continue
+                        else:
+                            nbyte = os.pwrite(dst, os.pread(src, nbyte, offset), offset)
+                        if nbyte == 0:
+                            ### The source file shrank out from under us
+                            break
+                        offset += nbyte
+                        
+                        ## Report progress in the same form as rsync
+                        tNow = time.time()
+                        if tNow - tLast >= 1 or offset >= size:
+                            speed = (offset - oStart) / max(tNow - tStart, 1e-6)
+                            rema = int((size - offset) / max(speed, 1.0))
+                            self._progress = (str(offset),
+                                              '%i%%' % (100*offset // max(size, 1)),
+                                              '%.2fMB/s' % (speed/1024**2),
+                                              '%i:%02i:%02i' % (rema // 3600, rema // 60 % 60, rema % 60))
+                            self.stdout = '%s %s %s %s' % self._progress
+                            tLast = tNow
+                            
+                finally:
+                    os.close(dst)
+            finally:
+                os.close(src)
+                
+            # Preserve the owner and group like rsync -a, as far as we are 
+            # allowed to, and then the permissions and times
+            try:
+                os.chown(target, srcStat.st_uid, srcStat.st_gid)
+            except PermissionError:
+                try:
+                    os.chown(target, -1, srcStat.st_gid)
+                except PermissionError:
+                    pass
+            shutil.copystat(self.hostpath, target)
+            
+        except OSError as e:
+            smartCommonLogger.debug('copy failed -> %s', str(e))
+            self.status = 'error: %s' % str(e)
+            return 1
+            
+        self.status = 'complete'
+        return 0
+        
     def _getDeleteCommand(self):
         """
         Build up a subprocess-compatible command needed to delete the data.
@@ -600,12 +918,12 @@ class InterruptibleCopy(object):
         
         if self.host == '':
             # Locally originating delete
-            cmd = ["rm" "-f", self.hostpath]
+            cmd = ["rm", "-f", self.hostpath]
             
         else:
             # Remotely originating delete
-            cmd = ["ssh", "-t", "-t", "mcsdr@%s" % self.host.lower()]
-            cmd.append( 'shopt -s huponexit && sudo rm -f %s' % self.hostpath )
+            cmd = list(self._ssh)
+            cmd.append( 'shopt -s huponexit && sudo -n rm -f %s' % self.hostpath )
             
         return cmd
         
@@ -614,45 +932,43 @@ class InterruptibleCopy(object):
         Start the delete.
         """
         
+        # Local files can be removed directly, just like 'rm -f'
+        if self.host == '':
+            try:
+                os.unlink(self.hostpath)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                smartCommonLogger.debug('delete failed -> %s', str(e))
+                self.status = 'error: %s' % str(e)
+                return 1
+                
+            self.status = 'complete'
+            return 0
+            
+        # Have we been paused while getting ready?
+        if self._halt.is_set():
+            self.status = 'paused'
+            return -1
+            
         # Get the command to use
         cmd = self._getDeleteCommand()
         
         # Start up the process and start looking at the stdout
-        self.process = subprocess.Popen(cmd, bufsize=1, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
-        watchOut = select.poll()
-        watchOut.register(self.process.stdout)
+        ## NOTE:  See _runCopy for the reason behind close_fds=False
+        cmd[0] = shutil.which(cmd[0]) or cmd[0]
+        self.process = subprocess.Popen(cmd, bufsize=0, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=False)
+        self._started.set()
+        if self._halt.is_set():
+            ## A pause came in while the process was launching
+            try:
+                self.process.kill()
+            except OSError:
+                pass
         smartCommonLogger.debug('Launched \'%s\' with PID %i', ' '.join(cmd), self.process.pid)
         
-        # Read from stdout while the copy is running so we can get 
-        # an idea of what is going on with the progress
-        while True:
-            ## Is there something to read?
-            stdout = ''
-            while watchOut.poll(1):
-                if self.process.poll() is None:
-                    try:
-                        new_text = self.process.stdout.read(1)
-                        new_text = new_text.decode()
-                        stdout += new_text
-                    except ValueError:
-                        break
-                else:
-                    break
-                    
-            ## Did we read something?  If not, sleep
-            if stdout == '':
-                time.sleep(1)
-            else:
-                self.stdout = stdout.rstrip()
-                
-            ## Are we done?
-            self.process.poll()
-            if self.process.returncode is not None:
-                ### Yes, break out of this endless loop
-                break
-                
-        # Pull out anything that might be stuck in the buffers
-        self.stdout, self.stderr = self.process.communicate()
+        # Follow the output until the process exits
+        self._watchProcess()
         
         smartCommonLogger.debug('PID %i exited with code %i', self.process.pid, self.process.returncode)
         
@@ -662,6 +978,6 @@ class InterruptibleCopy(object):
             self.status = 'paused'
         else:
             smartCommonLogger.debug('delete failed -> %s', self.stderr.rstrip())
-            self.status = 'error: %s' % self.stderr.decode()
+            self.status = 'error: %s' % self.stderr
             
         return self.process.returncode
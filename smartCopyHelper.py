@@ -4,12 +4,10 @@ import os
 import re
 import sys
 import zmq
-import math
 import time
 import socket
 import argparse
 import subprocess
-from datetime import datetime
 
 from zeroconf import Zeroconf
 
@@ -123,28 +121,11 @@ def get_time():
     Return a two-element tuple of the current MJD and MPM.
     """
     
-    # determine current time
-    dt = datetime.utcnow()
-    year        = dt.year             
-    month       = dt.month      
-    day         = dt.day    
-    hour        = dt.hour
-    minute      = dt.minute
-    second      = dt.second     
-    millisecond = dt.microsecond / 1000
-    
-    # compute MJD         
-    # adapted from http://paste.lisp.org/display/73536
-    # can check result using http://www.csgnetwork.com/julianmodifdateconv.html
-    a = (14 - month) // 12
-    y = year + 4800 - a          
-    m = month + (12 * a) - 3                    
-    p = day + (((153 * m) + 2) // 5) + (365 * y)   
-    q = (y // 4) - (y // 100) + (y // 400) - 32045
-    mjd = int(math.floor( (p+q) - 2400000.5))  
-    
-    # compute MPM
-    mpm = int(math.floor( (hour*3600 + minute*60 + second)*1000 + millisecond ))
+    # determine current time in ns since the Unix epoch (MJD 40587) and
+    # convert it to MJD and MPM
+    ns = time.time_ns()
+    mjd = 40587 + ns // 86400000000000
+    mpm = (ns // 1000000) % 86400000
     
     return (mjd, mpm)
 
@@ -161,21 +142,10 @@ def buildPayload(source, cmd, data=None, refSocket=None):
             
     mjd, mpm = get_time()
     
-    payload = ''
-    payload += 'SCM'
-    payload += source
-    payload += cmd
-    payload += '%9i' % ref
     if data is None:
-        payload += '%4i' % 0
-    else:
-        payload += '%4i' % len(data)
-    payload += '%6i' % mjd
-    payload += '%9i' % mpm
-    payload += ' '
-    if data is not None:
-        payload += data
-        
+        data = ''
+    payload = 'SCM%s%s%9i%4i%6i%9i %s' % (source, cmd, ref, len(data), mjd, mpm, data)
+    
     return payload
 
 
@@ -358,6 +328,7 @@ def main(args):
     try:
         sockOut = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sockOut.settimeout(5)
+        sockOut.connect((outHost, outPort))
         sockIn  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sockIn.bind(("0.0.0.0", inPort))
         sockIn.settimeout(5)
@@ -368,7 +339,7 @@ def main(args):
             if inf[:4] != 'Copy':
                 ## Standard SmartCopy commands
                 cmd = cmd.encode()
-                sockOut.sendto(cmd, (outHost, outPort))
+                sockOut.send(cmd)
                 data, address = sockIn.recvfrom(MCS_RCV_BYTES)
                 
                 data = data.decode()
@@ -3,12 +3,12 @@
 import os
 import re
 import sys
+import json
 import zmq
-import math
 import time
+import atexit
 import socket
 import argparse
-from datetime import datetime
 
 from zeroconf import Zeroconf
 
@@ -27,28 +27,11 @@ def getTime():
     Return a two-element tuple of the current MJD and MPM.
     """
     
-    # determine current time
-    dt = datetime.utcnow()
-    year        = dt.year             
-    month       = dt.month      
-    day         = dt.day    
-    hour        = dt.hour
-    minute      = dt.minute
-    second      = dt.second     
-    millisecond = dt.microsecond / 1000
-    
-    # compute MJD         
-    # adapted from http://paste.lisp.org/display/73536
-    # can check result using http://www.csgnetwork.com/julianmodifdateconv.html
-    a = (14 - month) // 12
-    y = year + 4800 - a          
-    m = month + (12 * a) - 3                    
-    p = day + (((153 * m) + 2) // 5) + (365 * y)   
-    q = (y // 4) - (y // 100) + (y // 400) - 32045
-    mjd = int(math.floor( (p+q) - 2400000.5))  
-    
-    # compute MPM
-    mpm = int(math.floor( (hour*3600 + minute*60 + second)*1000 + millisecond ))
+    # determine current time in ns since the Unix epoch (MJD 40587) and
+    # convert it to MJD and MPM
+    ns = time.time_ns()
+    mjd = 40587 + ns // 86400000000000
+    mpm = (ns // 1000000) % 86400000
     
     return (mjd, mpm)
 
@@ -65,21 +48,10 @@ def buildPayload(source, cmd, data=None, refSocket=None):
             
     mjd, mpm = getTime()
     
-    payload = ''
-    payload += 'SCM'
-    payload += source
-    payload += cmd
-    payload += '%9i' % ref
     if data is None:
-        payload += '%4i' % 0
-    else:
-        payload += '%4i' % len(data)
-    payload += '%6i' % mjd
-    payload += '%9i' % mpm
-    payload += ' '
-    if data is not None:
-        payload += data
-        
+        data = ''
+    payload = 'SCM%s%s%9i%4i%6i%9i %s' % (source, cmd, ref, len(data), mjd, mpm, data)
+    
     return payload
 
 
@@ -92,8 +64,13 @@ def parsePayload(payload):
     return cmdStatus, subStatus, data
 
 
-def main(args):
-    # Connect to the smart copy command server
+def _findServer():
+    """
+    Find the smart copy command server via zeroconf and return a five-element
+    tuple of the server address, server port, our three character name, the
+    port to receive replies on, and the reference ID server port.
+    """
+    
     tPoll = time.time()
     nametag = SITE.replace('lwa', '').lower()
     zinfo = None
@@ -106,10 +83,10 @@ def main(args):
                and b'message_out_port' not in zinfo.properties:
                 zinfo = None
                 
+        zeroconf.close()
         if zinfo is not None:
             break
             
-        zeroconf.close()
         time.sleep(1)
     if zinfo is None:
         raise RuntimeError("Cannot find the smart copy command server")
@@ -133,50 +110,129 @@ def main(args):
         inPort = int(zinfo.properties[b'message_out_port'], 10)
         refPort = int(zinfo.properties[b'message_ref_port'], 10)
         
-    context = zmq.Context()
-    sockRef = context.socket(zmq.REQ)
-    sockRef.connect("tcp://%s:%i" % (outHost, refPort))
-    sockRef.setsockopt(zmq.RCVTIMEO, 5000)
+    return outHost, outPort, inHost, inPort, refPort
+
+
+# Cached location of the smart copy command server, see _getConnection()
+_server = None
+
+# Cached connection to the smart copy command server, see _getConnection()
+_conn = None
+
+
+def _getConnection():
+    """
+    Return a four-element tuple of our three character name, the reference ID
+    server socket, the command socket, and the reply socket for talking to the
+    smart copy command server.  These are setup on the first call and then
+    reused until closeConnection() is called.  The zeroconf lookup of the
+    server is kept across closeConnection() calls.
+    """
+    
+    global _server, _conn
     
-    infs = []
-    cmds = []
-    for query in args.query:
-        infs.append( "Querying '%s'" % query )
-        cmds.append( buildPayload(inHost, 'RPT', data=query, refSocket=sockRef) )
+    if _conn is None:
+        if _server is None:
+            _server = _findServer()
+        outHost, outPort, inHost, inPort, refPort = _server
         
-    try:
-        sockOut = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sockOut.settimeout(5)
-        sockIn  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sockIn.bind(("0.0.0.0", inPort))
-        sockIn.settimeout(5)
+        context = zmq.Context()
+        sockRef = context.socket(zmq.REQ)
+        sockRef.connect("tcp://%s:%i" % (outHost, refPort))
+        sockRef.setsockopt(zmq.RCVTIMEO, 5000)
         
-        for inf,cmd in zip(infs,cmds):
-            print(inf)
-            
-            cmd = cmd.encode()
-            sockOut.sendto(cmd, (outHost, outPort))
-            data, address = sockIn.recvfrom(MCS_RCV_BYTES)
+        try:
+            sockOut = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sockOut.settimeout(5)
+            sockOut.connect((outHost, outPort))
+            sockIn  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sockIn.bind(("0.0.0.0", inPort))
+            sockIn.settimeout(5)
+        except socket.error as e:
+            sockRef.close()
+            context.term()
+            raise RuntimeError(str(e))
             
-            data = data.decode()
-            cStatus, sStatus, info = parsePayload(data)
-            info = info.split('\n')
-            if len(info) == 1:
-                print(cStatus, sStatus, info[0])
-            else:
-                print(cStatus, sStatus)
-                for line in info:
-                    print("  %s" % line)
-                    
+        _conn = (inHost, context, sockRef, sockOut, sockIn)
+        
+    inHost, context, sockRef, sockOut, sockIn = _conn
+    return inHost, sockRef, sockOut, sockIn
+
+
+def closeConnection():
+    """
+    Close the cached connection to the smart copy command server, if there is
+    one.  This frees up the reply port for other clients on this host.
+    """
+    
+    global _conn
+    
+    if _conn is not None:
+        inHost, context, sockRef, sockOut, sockIn = _conn
+        _conn = None
+        
         sockIn.close()
         sockOut.close()
-    except socket.error as e:
+        sockRef.close(linger=0)
+        context.term()
+
+
+atexit.register(closeConnection)
+
+
+def query(mib):
+    """
+    Query the smart copy server for the value of a MIB entry and return a
+    three-element tuple of the command status ('A' or 'R'), the server
+    status, and the value.
+    """
+    
+    global _server
+    
+    # Connect to the smart copy command server
+    inHost, sockRef, sockOut, sockIn = _getConnection()
+    
+    try:
+        cmd = buildPayload(inHost, 'RPT', data=mib, refSocket=sockRef)
+        cmd = cmd.encode()
+        sockOut.send(cmd)
+        
+        ## Skip over any late replies to earlier commands
+        while True:
+            data, address = sockIn.recvfrom(MCS_RCV_BYTES)
+            if data[9:18] == cmd[9:18]:
+                break
+    except (socket.error, RuntimeError) as e:
+        ## Start over with a new connection and a new lookup of the server
+        ## next time since the reference ID socket cannot be reused after a 
+        ## failure and the server may have moved
+        _server = None
+        closeConnection()
         raise RuntimeError(str(e))
         
-    sockRef.close()
-    context.term()
-    
-    zeroconf.close()
+    data = data.decode()
+    return parsePayload(data)
+
+
+def main(args):
+    for mib in args.query:
+        if args.json:
+            cStatus, sStatus, info = query(mib)
+            print(json.dumps({'query': mib, 'status': cStatus,
+                              'system': sStatus.strip(), 'value': info}))
+            continue
+            
+        print("Querying '%s'" % mib)
+        
+        cStatus, sStatus, info = query(mib)
+        info = info.split('\n')
+        if len(info) == 1:
+            print(cStatus, sStatus, info[0])
+        else:
+            print(cStatus, sStatus)
+            for line in info:
+                print("  %s" % line)
+                
     time.sleep(0.1)
 
 
@@ -205,6 +261,8 @@ if __name__ == "__main__":
         )
     parser.add_argument('query', type=mib, nargs='+',
                         help='MIB to query')
+    parser.add_argument('-j', '--json', action='store_true',
+                        help='print each result as a single line of JSON')
     parser.add_argument('-v', '--version', action='version', version='%(prog)s', 
                         help='display version information')
     args = parser.parse_args()
@@ -109,7 +109,7 @@ class MonitorStation(object):
                 self.SCCallbackInstance.processDRStateChange(dr, self.busy[dr])
                 
         self.thread = threading.Thread(target=self.pollStation, name='pollStation')
-        self.thread.setDaemon(1)
+        self.thread.daemon = True
         self.alive.set()
         self.thread.start()
         time.sleep(1)
@@ -209,7 +209,7 @@ class MonitorStation(object):
         watch.register(tail.stdout)
         
         # Go!
-        while self.alive.isSet():
+        while self.alive.is_set():
             try:
                 ## Is there anything to read?
                 if watch.poll(1):
@@ -293,7 +293,7 @@ class ManageDR(object):
             self.stop()
             
         self.thread = threading.Thread(target=self.processQueue, name='processQueue%s' % self.dr)
-        self.thread.setDaemon(1)
+        self.thread.daemon = True
         self.alive.set()
         self.thread.start()
         time.sleep(1)
@@ -356,7 +356,7 @@ class ManageDR(object):
         # Purges run late in the day (18:00 UTC)
         tLastPurge = (int(time.time())/86400)*86400 + 18*3600
         
-        while self.alive.isSet():
+        while self.alive.is_set():
             tStart = time.time()
             
             try:
@@ -646,7 +646,9 @@ class ManageDR(object):
                 timestamp, fsize, filename = entry.split(None, 2)
                 try:
                     assert(not self.inhibit)
-                    subprocess.check_output(['ssh', '-t', '-t', 'mcsdr@%s' % self.dr, 'shopt -s huponexit && sudo rm -f %s' % filename], stderr=subprocess.DEVNULL)
+                    cmd = getSSHCommand(self.dr)
+                    cmd.append('shopt -s huponexit && sudo -n rm -f %s' % filename)
+                    subprocess.check_output(cmd, stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
                     smartThreadsLogger.info('Removed %s:%s of size %s', self.dr, filename, fsize)
                 except AssertionError:
                     retry.append( (timestamp, fsize, filename) )
@@ -699,7 +701,7 @@ class MonitorErrorLogs(object):
             self.stop()
             
         self.thread = threading.Thread(target=self.monitorLogs, name='monitorLogs')
-        self.thread.setDaemon(1)
+        self.thread.daemon = True
         self.alive.set()
         self.thread.start()
         time.sleep(1)
@@ -724,7 +726,7 @@ class MonitorErrorLogs(object):
         # Checks run even later in the day (22:00 UTC)
         tLastCheck = (int(time.time())/86400)*86400 + 22*3600
         
-        while self.alive.isSet():
+        while self.alive.is_set():
             tStart = time.time()
             
             if tStart - tLastCheck >= 86400:
@@ -41,6 +41,12 @@ SITE = socket.gethostname().split('-', 1)[0]
 DEFAULTS_FILENAME = '/lwa/software/defaults.json'
 
 
+#
+# Splitter for host:path specifications that ignores escaped colons
+#
+_hostPathRE = re.compile(r'(?<!\\)\:')
+
+
 class MCSCommunicate(Communicate):
     """
     Class to deal with the communcating with MCS.
@@ -59,7 +65,8 @@ class MCSCommunicate(Communicate):
         
         destination, sender, command, reference, datalen, mjd, mpm, data, address = self.parsePacket(data)
         
-        self.logger.debug('Got command %s from %s: ref #%i', command, sender, reference)
+        if self._debug:
+            self.logger.debug('Got command %s from %s: ref #%i', command, sender, reference)
     
         # check destination and sender
         if destination in (self.SubSystemInstance.subSystem, 'ALL'):
@@ -242,8 +249,8 @@ class MCSCommunicate(Communicate):
             # SCP
             elif command == 'SCP':
                 src, dest = data.split('->', 1)
-                host, hostpath = re.split(r'(?<!\\)\:', src, 1)
-                dest, destpath = re.split(r'(?<!\\)\:', dest, 1)
+                host, hostpath = _hostPathRE.split(src, 1)
+                dest, destpath = _hostPathRE.split(dest, 1)
                 
                 status, exitCode = self.SubSystemInstance.addCopyCommand(host, host, hostpath, dest, destpath)
                 if status:
@@ -316,7 +323,7 @@ class MCSCommunicate(Communicate):
                     now = True
                     data = data.split('-tNOW', 1)[1]
                     data = data.strip()
-                host, hostpath = re.split(r'(?<!\\)\:', data, 1)
+                host, hostpath = _hostPathRE.split(data, 1)
                 
                 status, exitCode = self.SubSystemInstance.addDeleteCommand(host, host, hostpath, now=now)
                 if status:
@@ -479,14 +486,15 @@ def main(args):
             exc_type, exc_value, exc_traceback = sys.exc_info()
             logger.error("smart_cmnd.py failed with: %s at line %i", str(e), exc_traceback.tb_lineno)
                 
-            ## Grab the full traceback and save it to a string via StringIO
-            fileObject = StringIO()
-            traceback.print_tb(exc_traceback, file=fileObject)
-            tbString = fileObject.getvalue()
-            fileObject.close()
-            ## Print the traceback to the logger as a series of DEBUG messages
-            for line in tbString.split('\n'):
-                logger.debug("%s", line)
+            if logger.isEnabledFor(logging.DEBUG):
+                ## Grab the full traceback and save it to a string via StringIO
+                fileObject = StringIO()
+                traceback.print_tb(exc_traceback, file=fileObject)
+                tbString = fileObject.getvalue()
+                fileObject.close()
+                ## Print the traceback to the logger as a series of DEBUG messages
+                for line in tbString.split('\n'):
+                    logger.debug("%s", line)
                 
     # If we've made it this far, we have finished so shutdown SmartCopy and close the 
     # communications channels